@@ -0,0 +1,148 @@
+# backend/admission.py
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any
+
+# Scripts up to this length are handled as cheap work, matching is_short in /analyze
+SHORT_SCRIPT_CHARS = 6000
+# One cost unit per this many characters of a long script
+CHARS_PER_COST_UNIT = 20000
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; retry_after is the estimated seconds until capacity frees up."""
+
+    def __init__(self, lane: str, retry_after: float):
+        self.lane = lane
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"{lane} lane overloaded, retry after {self.retry_after}s")
+
+
+class Lane:
+    """
+    Bounded queue with a concurrency limit. Requests are shed up front when the predicted queue
+    wait (queued cost x observed seconds per cost unit / concurrency) would exceed the deadline.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, deadline: float, seconds_per_unit: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.seconds_per_unit = seconds_per_unit
+        self.active = 0
+        self.waiters: deque = deque()
+        self.queued_cost = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+
+    def estimated_wait(self, cost: float) -> float:
+        if self.active < self.concurrency and not self.waiters:
+            return 0.0
+        return (self.queued_cost + cost) * self.seconds_per_unit / self.concurrency
+
+    async def acquire(self, cost: float):
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        wait = self.estimated_wait(cost)
+        if len(self.waiters) >= self.max_queue or wait > self.deadline:
+            self.shed += 1
+            raise Overloaded(self.name, wait)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.queued_cost += cost
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.deadline)
+        except BaseException as e:
+            # Timed out or cancelled (client disconnect): leave the queue, or give back a slot
+            # that was handed over just as we gave up
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                waiter.cancel()
+            if not isinstance(e, asyncio.TimeoutError):
+                raise
+            self.timed_out += 1
+            self.shed += 1
+            raise Overloaded(self.name, self.estimated_wait(cost))
+        finally:
+            self.queued_cost -= cost
+        self.admitted += 1
+
+    def release(self):
+        """Hand the slot to the next waiter, or free it."""
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def observe(self, seconds: float, cost: float):
+        """Update the seconds-per-cost-unit estimate (EWMA) from a completed request."""
+        self.seconds_per_unit = 0.8 * self.seconds_per_unit + 0.2 * (seconds / cost)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "queue_depth": len(self.waiters),
+            "queued_cost": round(self.queued_cost, 2),
+            "seconds_per_unit": round(self.seconds_per_unit, 3),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+
+lanes = {
+    "cheap": Lane(
+        "cheap",
+        concurrency=int(os.getenv("ADMISSION_CHEAP_CONCURRENCY", "8")),
+        max_queue=int(os.getenv("ADMISSION_CHEAP_QUEUE", "32")),
+        deadline=float(os.getenv("ADMISSION_CHEAP_DEADLINE", "10")),
+        seconds_per_unit=20.0,
+    ),
+    "expensive": Lane(
+        "expensive",
+        concurrency=int(os.getenv("ADMISSION_EXPENSIVE_CONCURRENCY", "2")),
+        max_queue=int(os.getenv("ADMISSION_EXPENSIVE_QUEUE", "8")),
+        deadline=float(os.getenv("ADMISSION_EXPENSIVE_DEADLINE", "60")),
+        seconds_per_unit=30.0,
+    ),
+}
+
+
+def estimate_cost(endpoint: str, story_length: int):
+    """Pick the lane and cost units for a request from its endpoint and story length."""
+    if endpoint == "/analyze" and story_length > SHORT_SCRIPT_CHARS:
+        return "expensive", 1.0 + story_length / CHARS_PER_COST_UNIT
+    return "cheap", 1.0
+
+
+@asynccontextmanager
+async def admit(endpoint: str, story_length: int):
+    """Hold a slot in the request's lane for the enclosed work; raises Overloaded when shed."""
+    lane_name, cost = estimate_cost(endpoint, story_length)
+    lane = lanes[lane_name]
+    await lane.acquire(cost)
+    start = time.perf_counter()
+    try:
+        yield lane
+    finally:
+        lane.observe(time.perf_counter() - start, cost)
+        lane.release()
+
+
+def admission_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: lane.stats() for name, lane in lanes.items()}
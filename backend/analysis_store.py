@@ -0,0 +1,374 @@
+# backend/analysis_store.py
+# Columnar store of completed analyses for portfolio analytics.
+#
+# Rows are appended to a JSON lines write-ahead log and compacted into immutable NumPy
+# segments (.npz) of ANALYSIS_STORE_SEGMENT_ROWS rows. Multi-valued fields (genres, themes,
+# audience, comparable titles, emotional arc points) are dictionary-encoded with CSR
+# offsets, so group-by and percentile queries run as vectorized NumPy over the columns.
+import os
+import json
+import time
+import fcntl
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+STORE_DIR = os.getenv("ANALYSIS_STORE_DIR", "analysis_store")
+SEGMENT_ROWS = int(os.getenv("ANALYSIS_STORE_SEGMENT_ROWS", "1000"))
+
+KINDS = ["synopsis", "script"]
+SCORES = ["overall", "narrative_strength", "market_fit", "story_score"]
+LISTS = ["title", "genres", "themes", "tags", "audience", "comparables", "arc"]
+ARC_METRICS = ["intensity", "valence", "arousal"]
+
+# Query names for list columns
+GROUPS = {
+    "title": "title",
+    "genre": "genres",
+    "theme": "themes",
+    "tag": "tags",
+    "audience": "audience",
+    "comparable": "comparables",
+    "arc_point": "arc",
+}
+
+
+class AnalyticsQueryError(ValueError):
+    """Raised for queries naming unknown metrics, groups or filters."""
+
+
+def _float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _bound(name: str, value) -> float:
+    """A numeric filter value, or AnalyticsQueryError."""
+    if isinstance(value, bool):
+        raise AnalyticsQueryError(f"Filter '{name}' must be a number")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise AnalyticsQueryError(f"Filter '{name}' must be a number")
+
+
+def row_from_report(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a StoryImpactReport result (as returned by /analyze_synopsis) into a store row."""
+    scores = report.get("top_level_score", {})
+    insights = report.get("key_insights", {})
+    return {
+        "kind": "synopsis",
+        "timestamp": time.time(),
+        "title": [report.get("title", "")],
+        "overall": scores.get("overall"),
+        "narrative_strength": scores.get("narrative_strength"),
+        "market_fit": scores.get("market_fit"),
+        "genres": insights.get("genres", []),
+        "themes": insights.get("themes", []),
+        "audience": insights.get("target_audience", []),
+        "comparables": [m.get("Title", "") for m in report.get("similar_movies", [])],
+        "arc": [{"point": p["point"], "intensity": p.get("intensity")} for p in report.get("emotional_arc_data", [])],
+    }
+
+
+def row_from_analysis(analysis) -> Dict[str, Any]:
+    """Flatten an AnalysisResponse (as returned by /analyze) into a store row."""
+    return {
+        "kind": "script",
+        "timestamp": time.time(),
+        "story_score": analysis.story_score,
+        "tags": analysis.tags,
+        "audience": analysis.audience,
+        "arc": [{"point": p.point, "valence": p.valence, "arousal": p.arousal} for p in analysis.emotional_arc],
+    }
+
+
+def encode_rows(rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Encode rows into segment columns: scalar arrays plus <col>_labels/_offsets/_codes per list column."""
+    cols = {
+        "kind": np.array([KINDS.index(r["kind"]) for r in rows], dtype=np.int8),
+        "timestamp": np.array([r["timestamp"] for r in rows], dtype=np.float64),
+    }
+    for score in SCORES:
+        cols[score] = np.array([_float(r.get(score)) for r in rows], dtype=np.float32)
+
+    arc_points = []
+    for col in LISTS:
+        labels: Dict[str, int] = {}
+        offsets, codes = [0], []
+        for r in rows:
+            # Labels are grouped case-insensitively, so keep one spelling per row (the first) or
+            # the row would be counted twice in its group
+            seen = set()
+            for item in r.get(col) or []:
+                label = str(item["point"] if col == "arc" else item).strip()
+                if label.casefold() in seen:
+                    continue
+                seen.add(label.casefold())
+                codes.append(labels.setdefault(label, len(labels)))
+                if col == "arc":
+                    arc_points.append(item)
+            offsets.append(len(codes))
+        cols[f"{col}_labels"] = np.array(list(labels), dtype=str)
+        cols[f"{col}_offsets"] = np.array(offsets, dtype=np.int64)
+        cols[f"{col}_codes"] = np.array(codes, dtype=np.int32)
+
+    for metric in ARC_METRICS:
+        cols[f"arc_{metric}"] = np.array([_float(p.get(metric)) for p in arc_points], dtype=np.float32)
+    return cols
+
+
+def _grouped_stats(keys: np.ndarray, values: np.ndarray, percentiles: List[float]) -> Dict[str, np.ndarray]:
+    """Count, mean, min, max and percentiles of values per key, fully vectorized."""
+    keep = ~np.isnan(values)
+    keys, values = keys[keep], values[keep].astype(np.float64)
+    if len(keys) == 0:
+        return {"key": keys, "count": keys}
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    counts = np.diff(np.concatenate((starts, [len(keys)])))
+    stats = {
+        "key": keys[starts],
+        "count": counts,
+        "mean": np.add.reduceat(values, starts) / counts,
+        "min": values[starts],
+        "max": values[starts + counts - 1],
+    }
+    for q in percentiles:
+        pos = starts + (q / 100.0) * (counts - 1)
+        lo, hi = np.floor(pos).astype(np.int64), np.ceil(pos).astype(np.int64)
+        stats[f"p{q:g}"] = values[lo] + (values[hi] - values[lo]) * (pos - lo)
+    return stats
+
+
+
+def _merge(base: Optional[Dict[str, Any]], parts: List[Dict[str, np.ndarray]]) -> Dict[str, Any]:
+    """
+    Concatenate encoded parts onto already merged columns (or none), remapping per-part label
+    codes to global codes. Only the parts are re-encoded; base columns are copied as-is.
+    """
+    if base is None and not parts:
+        parts = [encode_rows([])]
+    head = [base] if base is not None else []
+    cols: Dict[str, Any] = {
+        name: np.concatenate([p[name] for p in head + parts])
+        for name in ["kind", "timestamp", *SCORES] + [f"arc_{m}" for m in ARC_METRICS]
+    }
+    for col in LISTS:
+        labels: List[str] = list(base[f"{col}_labels"]) if base is not None else []
+        index: Dict[str, int] = dict(base[f"{col}_index"]) if base is not None else {}
+
+        def global_code(label: str) -> int:
+            key = label.casefold()
+            if key not in index:
+                index[key] = len(labels)
+                labels.append(label)
+            return index[key]
+
+        offsets = [base[f"{col}_offsets"] if base is not None else np.zeros(1, dtype=np.int64)]
+        codes = [base[f"{col}_codes"]] if base is not None else []
+        rows = [base[f"{col}_rows"]] if base is not None else []
+        total = int(offsets[0][-1])
+        row_base = len(base["kind"]) if base is not None else 0
+        for p in parts:
+            part_offsets = p[f"{col}_offsets"]
+            lut = np.array([global_code(l) for l in p[f"{col}_labels"].tolist()], dtype=np.int32)
+            codes.append(lut[p[f"{col}_codes"]] if len(lut) else p[f"{col}_codes"])
+            offsets.append(part_offsets[1:] + total)
+            rows.append(np.repeat(np.arange(len(part_offsets) - 1) + row_base, np.diff(part_offsets)))
+            total += int(part_offsets[-1])
+            row_base += len(part_offsets) - 1
+        cols[f"{col}_labels"] = labels
+        cols[f"{col}_index"] = index
+        cols[f"{col}_offsets"] = np.concatenate(offsets)
+        cols[f"{col}_codes"] = np.concatenate(codes).astype(np.int32)
+        cols[f"{col}_rows"] = np.concatenate(rows).astype(np.int64)
+    return cols
+
+class AnalysisStore:
+    """Append-only columnar store shared by all workers through STORE_DIR."""
+
+    def __init__(self, path: str = STORE_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.wal_path = os.path.join(path, "pending.jsonl")
+        self.lock_path = os.path.join(path, ".lock")
+        self._segments: Dict[str, Dict[str, np.ndarray]] = {}
+        self._wal_rows: List[Dict[str, Any]] = []
+        self._wal_offset = 0
+        self._base: Optional[Dict[str, Any]] = None
+        self._cols: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def _file_lock(self, mode: int):
+        f = open(self.lock_path, "a")
+        fcntl.flock(f, mode)
+        return f
+
+    def append(self, row: Dict[str, Any]):
+        """Append one analysis row; compacts the log into a segment once it is large enough."""
+        line = json.dumps(row) + "\n"
+        with self._lock:
+            lock = self._file_lock(fcntl.LOCK_EX)
+            try:
+                with open(self.wal_path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                if self._wal_lines() >= SEGMENT_ROWS:
+                    self._compact()
+            finally:
+                lock.close()
+
+    def _wal_lines(self) -> int:
+        with open(self.wal_path, "rb") as f:
+            return sum(1 for _ in f)
+
+    def _compact(self):
+        """Move the log into a new immutable segment. Caller holds the exclusive file lock."""
+        with open(self.wal_path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        if not rows:
+            return
+        name = f"segment-{time.time_ns()}-{os.getpid()}.npz"
+        tmp = os.path.join(self.path, f".{name}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **encode_rows(rows))
+        os.replace(tmp, os.path.join(self.path, name))
+        open(self.wal_path, "w").close()
+
+    def _refresh(self):
+        """Load new segments and log rows written by any worker since the last query."""
+        lock = self._file_lock(fcntl.LOCK_SH)
+        try:
+            names = sorted(n for n in os.listdir(self.path) if n.startswith("segment-") and n.endswith(".npz"))
+            new_segments = False
+            for name in names:
+                if name not in self._segments:
+                    with np.load(os.path.join(self.path, name)) as data:
+                        self._segments[name] = {k: data[k] for k in data.files}
+                    new_segments = True
+            changed = new_segments
+            size = os.path.getsize(self.wal_path) if os.path.exists(self.wal_path) else 0
+            if changed or size < self._wal_offset:
+                # Log was compacted: its rows now live in the new segment
+                self._wal_rows, self._wal_offset = [], 0
+                changed = True
+            if size > self._wal_offset:
+                with open(self.wal_path, "rb") as f:
+                    f.seek(self._wal_offset)
+                    data = f.read(size - self._wal_offset)
+                complete = data[:data.rfind(b"\n") + 1]
+                self._wal_rows.extend(json.loads(line) for line in complete.splitlines() if line.strip())
+                self._wal_offset += len(complete)
+                changed = changed or bool(complete)
+        finally:
+            lock.close()
+        if new_segments or self._base is None:
+            # Segments are immutable, so their merged columns are reused until a new one appears
+            self._base = _merge(None, list(self._segments.values()))
+        if changed or self._cols is None:
+            self._cols = _merge(self._base, [encode_rows(self._wal_rows)]) if self._wal_rows else self._base
+
+    def query(
+        self,
+        metric: str,
+        group_by: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        percentiles: List[float] = (50, 90),
+        limit: int = 50,
+    ) -> Dict[str, Any]:
+        """
+        Aggregate a score (or arc metric) over stored analyses.
+
+        Args:
+            metric: One of SCORES, or intensity/valence/arousal for emotional arc points.
+            group_by: kind, genre, theme, tag, audience, comparable or arc_point; None for one group.
+            filters: kind, since/until (unix time), min/max {score: bound}, or a label per group name
+                (e.g. {"genre": "Horror"}).
+            percentiles: Percentiles to report per group.
+            limit: Maximum number of groups, largest first.
+        """
+        start = time.perf_counter()
+        for q in percentiles:
+            if not 0 <= q <= 100:
+                raise AnalyticsQueryError(f"Percentile {q} is outside 0..100")
+        with self._lock:
+            self._refresh()
+            cols = self._cols
+        n = len(cols["kind"])
+        mask = np.ones(n, dtype=bool)
+
+        for key, value in (filters or {}).items():
+            if key == "kind":
+                if value not in KINDS:
+                    raise AnalyticsQueryError(f"Unknown kind '{value}', expected one of {KINDS}")
+                mask &= cols["kind"] == KINDS.index(value)
+            elif key == "since":
+                mask &= cols["timestamp"] >= _bound(key, value)
+            elif key == "until":
+                mask &= cols["timestamp"] < _bound(key, value)
+            elif key in ("min", "max"):
+                if not isinstance(value, dict):
+                    raise AnalyticsQueryError(f"Filter '{key}' must map scores to bounds")
+                for score, bound in value.items():
+                    if score not in SCORES:
+                        raise AnalyticsQueryError(f"Unknown score '{score}'")
+                    bound = _bound(f"{key}.{score}", bound)
+                    mask &= cols[score] >= bound if key == "min" else cols[score] <= bound
+            elif key in GROUPS:
+                col = GROUPS[key]
+                code = cols[f"{col}_index"].get(str(value).strip().casefold())
+                matches = np.zeros(n, dtype=bool)
+                if code is not None:
+                    matches[cols[f"{col}_rows"][cols[f"{col}_codes"] == code]] = True
+                mask &= matches
+            else:
+                raise AnalyticsQueryError(f"Unknown filter '{key}'")
+
+        if metric in ARC_METRICS:
+            if group_by not in (None, "arc_point"):
+                raise AnalyticsQueryError("Arc metrics can only be grouped by arc_point")
+            rows = cols["arc_rows"]
+            keep = mask[rows]
+            values = cols[f"arc_{metric}"][keep]
+            keys = cols["arc_codes"][keep] if group_by else np.zeros(len(values), dtype=np.int32)
+        elif metric in SCORES:
+            if group_by in GROUPS:
+                col = GROUPS[group_by]
+                rows = cols[f"{col}_rows"]
+                keep = mask[rows]
+                values = cols[metric][rows[keep]]
+                keys = cols[f"{col}_codes"][keep]
+            elif group_by == "kind":
+                values, keys = cols[metric][mask], cols["kind"][mask]
+            elif group_by is None:
+                values = cols[metric][mask]
+                keys = np.zeros(len(values), dtype=np.int32)
+            else:
+                raise AnalyticsQueryError(f"Unknown group_by '{group_by}'")
+        else:
+            raise AnalyticsQueryError(f"Unknown metric '{metric}'")
+
+        stats = _grouped_stats(keys, values, list(percentiles))
+        if group_by == "kind":
+            names = KINDS
+        elif group_by:
+            names = cols[f"{GROUPS[group_by]}_labels"]
+        else:
+            names = ["all"]
+        order = np.argsort(-stats["count"], kind="stable")[:limit]
+        groups = [
+            {name: (names[int(v[i])] if name == "key" else int(v[i]) if name == "count" else round(float(v[i]), 3))
+             for name, v in stats.items()}
+            for i in order
+        ]
+        return {
+            "metric": metric,
+            "group_by": group_by,
+            "rows_matched": int(mask.sum()),
+            "rows_total": n,
+            "groups": groups,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+        }
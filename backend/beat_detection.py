@@ -0,0 +1,141 @@
+# backend/beat_detection.py
+import re
+import numpy as np
+from typing import List, Dict, Any, Callable, Tuple
+from utils import raw_valence_arousal
+
+SCENE_HEADING = re.compile(r'^\s*(?:INT\.|EXT\.|INT/EXT\.?|I/E\.?|EST\.)', re.MULTILINE)
+
+# Structural windows (fraction of the script) each beat is searched in
+BEAT_WINDOWS = {
+    "End of Act I": (0.15, 0.35),
+    "Midpoint": (0.40, 0.60),
+    "All is Lost Moment": (0.60, 0.85),
+    "Climax": (0.80, 0.97),
+}
+
+MIN_SCENES = 12
+FALLBACK_SCENE_LENGTH = 3000
+SCENE_SCORE_CHARS = 2000
+SCENE_BATCH_SIZE = 16
+BEAT_TEXT_CHARS = 5000
+
+
+def split_scenes(script: str) -> List[str]:
+    """Split a screenplay on scene headings, falling back to fixed windows for unformatted text."""
+    starts = [m.start() for m in SCENE_HEADING.finditer(script)]
+    scenes = []
+    if starts:
+        bounds = ([0] if starts[0] > 0 else []) + starts + [len(script)]
+        scenes = [script[a:b].strip() for a, b in zip(bounds, bounds[1:])]
+        scenes = [s for s in scenes if s]
+    if len(scenes) < MIN_SCENES:
+        # Nearly equal windows of at most FALLBACK_SCENE_LENGTH, so no tiny tail scene is left over
+        length = min(FALLBACK_SCENE_LENGTH, max(1, len(script) // MIN_SCENES))
+        count = -(-len(script) // length)
+        bounds = np.linspace(0, len(script), count + 1).astype(int)
+        scenes = [script[a:b] for a, b in zip(bounds, bounds[1:])]
+    return scenes
+
+
+def score_scenes(scenes: List[str], emotion_model: Callable) -> Tuple[np.ndarray, np.ndarray]:
+    """Score every scene with the emotion model in one batched call."""
+    outputs = emotion_model(
+        [s[:SCENE_SCORE_CHARS] for s in scenes], truncation=True, batch_size=SCENE_BATCH_SIZE
+    )
+    pairs = [raw_valence_arousal(scores) for scores in outputs]
+    valence = np.array([p[0] for p in pairs], dtype=float)
+    arousal = np.array([p[1] for p in pairs], dtype=float)
+    return valence, arousal
+
+
+def smooth(series: np.ndarray, window: int) -> np.ndarray:
+    """Centered moving average with edge padding so the output keeps the input length."""
+    if window <= 1 or len(series) < 3:
+        return series.copy()
+    window = min(window, len(series))
+    if window % 2 == 0:
+        window -= 1
+    pad = window // 2
+    padded = np.pad(series, (pad, pad), mode="edge")
+    return np.convolve(padded, np.ones(window) / window, mode="valid")
+
+
+def change_point_scores(series: np.ndarray, half_width: int) -> np.ndarray:
+    """Mean-shift score at each index: |mean of the following span - mean of the preceding span|."""
+    n = len(series)
+    csum = np.concatenate(([0.0], np.cumsum(series)))
+    idx = np.arange(n)
+    left_start = np.maximum(idx - half_width, 0)
+    right_end = np.minimum(idx + half_width, n)
+    left = (csum[idx] - csum[left_start]) / np.maximum(idx - left_start, 1)
+    right = (csum[right_end] - csum[idx]) / np.maximum(right_end - idx, 1)
+    scores = np.abs(right - left)
+    scores[0] = 0.0
+    return scores
+
+
+def _window(n: int, beat: str, after: int, remaining: int) -> np.ndarray:
+    """
+    Scene indices allowed for a beat: inside its structural window, after the previous beat and
+    early enough that the `remaining` later beats still fit before the last scene. Never empty
+    when n >= len(BEAT_WINDOWS) + 2.
+    """
+    lo, hi = BEAT_WINDOWS[beat]
+    cap = n - 2 - remaining
+    start = min(max(int(lo * n), after + 1), cap)
+    end = min(max(int(np.ceil(hi * n)), start + 1), cap + 1)
+    return np.arange(start, end)
+
+
+def locate_beats(valence: np.ndarray, arousal: np.ndarray) -> Dict[str, int]:
+    """
+    Locate the six structural beats on smoothed valence/arousal series.
+
+    End of Act I and Midpoint are the strongest emotional turns (change points) in their
+    windows, All is Lost is the valence minimum and Climax the arousal maximum.
+
+    Returns:
+        Mapping of beat name to scene index, strictly increasing in story order.
+    """
+    n = len(valence)
+    window = max(3, (n // 15) | 1)
+    v = smooth(valence, window)
+    a = smooth(arousal, window)
+    turns = change_point_scores(v, window) + 0.5 * change_point_scores(a, window)
+
+    beats = (
+        ("End of Act I", turns, np.argmax),
+        ("Midpoint", turns, np.argmax),
+        ("All is Lost Moment", v, np.argmin),
+        ("Climax", a, np.argmax),
+    )
+    picks = {"Beginning": 0}
+    last = 0
+    for i, (beat, series, pick) in enumerate(beats):
+        candidates = _window(n, beat, last, len(beats) - 1 - i)
+        last = int(candidates[pick(series[candidates])])
+        picks[beat] = last
+    picks["End"] = n - 1
+    return picks
+
+
+def detect_beats(story: str, emotion_model: Callable) -> Dict[str, Any]:
+    """
+    Detect narrative beats locally from the scene-level emotion time series.
+
+    Args:
+        story: The input screenplay text.
+        emotion_model: Hugging Face text-classification pipeline returning all scores.
+
+    Returns:
+        Dictionary of beat name to the text of the scene at that beat, matching the
+        'beats' object produced by the GPT structure analysis.
+    """
+    scenes = split_scenes(story)
+    if len(scenes) < len(BEAT_WINDOWS) + 2:
+        return {"Beginning": scenes[0][:BEAT_TEXT_CHARS], "End": scenes[-1][:BEAT_TEXT_CHARS]} if scenes else {}
+
+    valence, arousal = score_scenes(scenes, emotion_model)
+    picks = locate_beats(valence, arousal)
+    return {beat: scenes[i][:BEAT_TEXT_CHARS] for beat, i in picks.items()}
@@ -0,0 +1,332 @@
+# backend/catalog.py
+# Offline movie-metadata mirror: SQLite with an FTS5 trigram index on normalized titles, plus a
+# trigram table keyed by title length that fuzzy title/year lookups probe.
+#
+#   python catalog.py ingest movies.jsonl [--db catalog.db]
+#
+# Accepts JSON lines (optionally .gz) of TMDb movie details (title, release_date, genres, ...)
+# or records already in the merged TMDb/OMDb format (Title, Year, Genres, ...).
+import os
+import re
+import gzip
+import json
+import sqlite3
+import hashlib
+import argparse
+import threading
+from difflib import SequenceMatcher
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from fetch_data import normalize_title
+from deadline import Deadline
+
+CATALOG_PATH = os.getenv("MOVIE_CATALOG_PATH", "catalog.db")
+MIN_TITLE_SIMILARITY = float(os.getenv("CATALOG_MIN_SIMILARITY", "0.85"))
+FUZZY_CANDIDATES = 20
+# Fuzzy lookups only probe this many of the query's rarest trigrams, and rank at most
+# MAX_FUZZY_CANDIDATES of the titles sharing enough of them
+RARE_TRIGRAMS = 6
+MAX_FUZZY_CANDIDATES = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS movies (
+    id INTEGER PRIMARY KEY,
+    norm_title TEXT NOT NULL,
+    year INTEGER,
+    popularity REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_movies_title_year ON movies(norm_title, year);
+CREATE VIRTUAL TABLE IF NOT EXISTS titles_fts USING fts5(
+    norm_title, content='movies', content_rowid='id', tokenize='trigram'
+);
+CREATE TABLE IF NOT EXISTS trigrams (term TEXT PRIMARY KEY, docs INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS title_trigrams (
+    gram TEXT NOT NULL,
+    len INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (gram, len, id)
+) WITHOUT ROWID;
+"""
+
+# Every distinct trigram of every title, keyed by title length so fuzzy lookups only read
+# postings of titles long or short enough to reach MIN_TITLE_SIMILARITY
+BUILD_TITLE_TRIGRAMS = """
+INSERT OR IGNORE INTO title_trigrams
+WITH RECURSIVE pos(i) AS (
+    SELECT 1 UNION ALL SELECT i + 1 FROM pos WHERE i < (SELECT max(length(norm_title)) FROM movies) - 2
+)
+SELECT substr(m.norm_title, pos.i, 3), length(m.norm_title), m.id
+FROM movies m JOIN pos ON pos.i <= length(m.norm_title) - 2
+ORDER BY 1, 2, 3
+"""
+
+
+def catalog_title(title: str) -> str:
+    """Normalized title as stored in the catalog; normalizes typographic apostrophes."""
+    title = title.replace("’", "'").replace("‘", "'")
+    return " ".join(normalize_title(title).split())
+
+
+def title_candidates(title: str) -> List[Tuple[str, Optional[int]]]:
+    """
+    (normalized title, year) readings of a query, most literal first. A year in parentheses or
+    brackets is always split off ('Hereditary (2018)'); a bare trailing year is only tried after
+    the full title, since it may belong to it ('Blade Runner 2049').
+    """
+    match = re.search(r'\s*[\(\[]((?:19|20)\d{2})[\)\]]\s*$', title)
+    if match and match.start() > 0:
+        return [(catalog_title(title[:match.start()]), int(match.group(1)))]
+    candidates = [(catalog_title(title), None)]
+    match = re.search(r'\s+((?:19|20)\d{2})\s*$', title)
+    if match and match.start() > 0:
+        candidates.append((catalog_title(title[:match.start()]), int(match.group(1))))
+    return [c for c in candidates if c[0]]
+
+
+def to_record(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Convert a TMDb detail or merged-format record to the search_tmdb_movies_by_titles result format."""
+    if "Title" in raw:
+        record = dict(raw)
+        record["Year"] = str(record.get("Year", ""))[:4]
+    elif raw.get("title"):
+        credits = raw.get("credits", {})
+        keywords = raw.get("keywords", [])
+        if isinstance(keywords, dict):
+            keywords = keywords.get("keywords", [])
+        record = {
+            "Title": raw["title"],
+            "Year": (raw.get("release_date") or "")[:4],
+            "Genres": [g["name"] if isinstance(g, dict) else g for g in raw.get("genres", [])],
+            "Overview": raw.get("overview", ""),
+            "Keywords": [k["name"] if isinstance(k, dict) else k for k in keywords],
+            "Cast": [c["name"] for c in credits.get("cast", [])[:3]],
+            "Director": next((c["name"] for c in credits.get("crew", []) if c.get("job") == "Director"), ""),
+            "Popularity": raw.get("popularity", ""),
+            "VoteAverage": raw.get("vote_average", ""),
+            "VoteCount": raw.get("vote_count", ""),
+            "Budget": raw.get("budget", 0),
+            "Revenue": raw.get("revenue", 0),
+            "Poster_Path": raw.get("poster_path") or "",
+        }
+    else:
+        return None
+    record["source"] = "Catalog"
+    return record
+
+
+def record_id(raw: Dict[str, Any], norm_title: str, year: Optional[int]) -> int:
+    """
+    TMDb id when present; otherwise a stable negative key derived from (title, year) so that
+    re-ingesting merged-format records replaces them instead of duplicating them.
+    """
+    if isinstance(raw.get("id"), int):
+        return raw["id"]
+    digest = hashlib.blake2b(f"{norm_title}|{year}".encode("utf-8"), digest_size=7).digest()
+    return -1 - int.from_bytes(digest, "big")
+
+
+def _read_lines(path: str) -> Iterator[Dict[str, Any]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def ingest(path: str, db_path: str = CATALOG_PATH, batch_size: int = 5000) -> int:
+    """Bulk-load a JSON lines catalog snapshot into SQLite and rebuild the trigram index."""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    count, skipped, batch = 0, 0, []
+    for raw in _read_lines(path):
+        try:
+            record = to_record(raw)
+            if not record:
+                continue
+            norm_title = catalog_title(record["Title"])
+            year = int(record["Year"]) if record["Year"].isdigit() else None
+            popularity = record.get("Popularity")
+            popularity = float(popularity) if isinstance(popularity, (int, float)) else 0.0
+            row = (record_id(raw, norm_title, year), norm_title, year, popularity, json.dumps(record))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            skipped += 1
+            continue
+        batch.append(row)
+        if len(batch) >= batch_size:
+            count += _insert(conn, batch)
+            batch = []
+    count += _insert(conn, batch)
+
+    conn.execute("INSERT INTO titles_fts(titles_fts) VALUES('rebuild')")
+    # Document frequency per trigram, so fuzzy lookups can probe only the rarest ones
+    conn.execute("CREATE VIRTUAL TABLE temp.titles_vocab USING fts5vocab(main, titles_fts, 'row')")
+    conn.execute("DELETE FROM trigrams")
+    conn.execute("INSERT INTO trigrams SELECT term, doc FROM temp.titles_vocab")
+    conn.execute("DELETE FROM title_trigrams")
+    conn.execute(BUILD_TITLE_TRIGRAMS)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    if skipped:
+        print(f"Skipped {skipped} malformed catalog records")
+    return count
+
+
+def _insert(conn: sqlite3.Connection, batch: List[tuple]) -> int:
+    conn.executemany(
+        "INSERT OR REPLACE INTO movies (id, norm_title, year, popularity, data) VALUES (?, ?, ?, ?, ?)",
+        batch,
+    )
+    return len(batch)
+
+
+class MovieCatalog:
+    """Read-only fuzzy title/year resolver over an ingested catalog."""
+
+    def __init__(self, db_path: str):
+        self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        tables = {r[0] for r in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.fuzzy = {"trigrams", "title_trigrams"} <= tables
+        if not self.fuzzy:
+            print(f"Catalog {db_path} has no trigram tables; re-run ingest to enable fuzzy title matching")
+
+    def _pick(self, rows: List[tuple], year: Optional[int]) -> Optional[tuple]:
+        if year is not None:
+            rows = [r for r in rows if r[1] is None or abs(r[1] - year) <= 1]
+            return min(rows, key=lambda r: (abs((r[1] or year) - year), -(r[2] or 0)), default=None)
+        return max(rows, key=lambda r: r[2] or 0, default=None)
+
+    def _fuzzy_rows(self, norm_title: str, year: Optional[int]) -> List[tuple]:
+        """
+        Rows most similar to norm_title by trigram overlap. Candidates must share at least half of
+        the query's rarest trigrams and have a title length that can reach MIN_TITLE_SIMILARITY,
+        so common trigrams ("the") never pull in most of the table.
+        """
+        trigrams = {norm_title[i:i + 3] for i in range(len(norm_title) - 2)}
+        docs = dict(self.conn.execute(
+            f"SELECT term, docs FROM trigrams WHERE term IN ({','.join('?' * len(trigrams))})", list(trigrams)
+        ).fetchall())
+        # Trigrams absent from the catalog (typos) can't match anything; if most are absent, no
+        # title is close enough
+        present = [t for t in trigrams if docs.get(t)]
+        if not present or len(present) * 2 < len(trigrams):
+            return []
+        rare = sorted(present, key=docs.get)[:RARE_TRIGRAMS]
+        # SequenceMatcher ratio is 2M / (a + b) with M <= min(a, b), which bounds the length ratio
+        r = MIN_TITLE_SIMILARITY
+        candidates = self.conn.execute(
+            "SELECT m.id, m.norm_title FROM ("
+            f"SELECT id, COUNT(*) AS shared FROM title_trigrams WHERE gram IN ({','.join('?' * len(rare))}) "
+            "AND len BETWEEN ? AND ? GROUP BY id HAVING shared >= ?"
+            ") c JOIN movies m ON m.id = c.id "
+            "WHERE ? IS NULL OR m.year IS NULL OR abs(m.year - ?) <= 1 "
+            "ORDER BY c.shared DESC LIMIT ?",
+            (
+                *rare,
+                int(len(norm_title) * r / (2 - r)),
+                int(len(norm_title) * (2 - r) / r) + 1,
+                (len(rare) + 1) // 2,
+                year, year,
+                MAX_FUZZY_CANDIDATES,
+            ),
+        ).fetchall()
+
+        def overlap(title: str) -> float:
+            grams = {title[i:i + 3] for i in range(len(title) - 2)}
+            return len(trigrams & grams) / len(trigrams | grams)
+
+        best = sorted(candidates, key=lambda c: overlap(c[1]), reverse=True)[:FUZZY_CANDIDATES]
+        if not best:
+            return []
+        return self.conn.execute(
+            f"SELECT data, year, popularity, norm_title FROM movies WHERE id IN ({','.join('?' * len(best))})",
+            [c[0] for c in best],
+        ).fetchall()
+
+    def resolve(self, title: str) -> Optional[Dict[str, Any]]:
+        """Resolve a possibly inexact title (optionally suffixed with a year) to a catalog record."""
+        candidates = title_candidates(title)
+        with self._lock:
+            for norm_title, year in candidates:
+                rows = self.conn.execute(
+                    "SELECT data, year, popularity FROM movies WHERE norm_title = ?", (norm_title,)
+                ).fetchall()
+                best = self._pick(rows, year)
+                if best:
+                    return json.loads(best[0])
+            for norm_title, year in candidates:
+                if len(norm_title) < 3 or not self.fuzzy:
+                    continue
+                rows = self._fuzzy_rows(norm_title, year)
+                rows = [r for r in rows if SequenceMatcher(None, norm_title, r[3]).ratio() >= MIN_TITLE_SIMILARITY]
+                best = self._pick(rows, year)
+                if best:
+                    return json.loads(best[0])
+        return None
+
+    def lookup_titles(
+        self, titles: List[str], top_n: int = 5, deadline: Optional[Deadline] = None
+    ) -> Tuple[List[Dict], List[str]]:
+        """
+        Resolve titles locally; returns (records, titles that missed and need a live lookup).
+        Titles left when the deadline expires are returned as misses.
+        """
+        found, misses = [], []
+        for title in titles[:top_n]:
+            if not title.strip():
+                continue
+            if deadline and deadline.expired():
+                misses.append(title)
+                continue
+            record = self.resolve(title)
+            if record:
+                found.append(record)
+            else:
+                misses.append(title)
+        return found, misses
+
+
+_catalog = None
+
+
+def get_catalog() -> Optional[MovieCatalog]:
+    """Lazily open the catalog in the current process, or None if no catalog has been ingested."""
+    global _catalog
+    if _catalog is None and os.path.exists(CATALOG_PATH):
+        _catalog = MovieCatalog(CATALOG_PATH)
+    return _catalog
+
+
+def reset_catalog():
+    """Drop the connection so a forked worker opens its own."""
+    global _catalog
+    _catalog = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Movie metadata catalog")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest_cmd = sub.add_parser("ingest", help="Bulk-load a JSON lines catalog snapshot")
+    ingest_cmd.add_argument("path")
+    ingest_cmd.add_argument("--db", default=CATALOG_PATH)
+    resolve_cmd = sub.add_parser("resolve", help="Resolve titles against the catalog")
+    resolve_cmd.add_argument("titles", nargs="+")
+    resolve_cmd.add_argument("--db", default=CATALOG_PATH)
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        print(f"Ingested {ingest(args.path, args.db)} movies into {args.db}")
+    else:
+        catalog = MovieCatalog(args.db)
+        for title in args.titles:
+            record = catalog.resolve(title)
+            print(f"{title!r} -> {record['Title'] + ' (' + record['Year'] + ')' if record else 'not found'}")
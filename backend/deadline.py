@@ -0,0 +1,176 @@
+# backend/deadline.py
+import os
+import time
+import threading
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional
+
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "1.0"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("UPSTREAM_THREADS", "16")), thread_name_prefix="upstream")
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call is attempted with no time left in the request budget."""
+
+
+class ProviderUnavailable(Exception):
+    """Raised when a provider's circuit breaker is open."""
+
+
+class Deadline:
+    """
+    Time budget for one request. Calls take timeout() so each gets only the time it has left,
+    and record skipped lookups so the response can flag partial data.
+    """
+
+    def __init__(self, seconds: float, parent: "Deadline" = None):
+        self.expires_at = time.monotonic() + seconds
+        self.skipped: List[str] = parent.skipped if parent else []
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float = None) -> float:
+        """Seconds available for the next call, capped at `cap`; raises DeadlineExceeded if none."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        return min(cap, remaining) if cap else remaining
+
+    def reserve(self, seconds: float) -> "Deadline":
+        """Sub-budget that ends `seconds` before this one, leaving time for later stages."""
+        return Deadline(max(0.0, self.remaining() - seconds), parent=self)
+
+    def skip(self, what: str):
+        self.skipped.append(what)
+
+
+class LatencyTracker:
+    """Recent successful latencies of a provider, used to pick the hedge delay."""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def p95(self) -> float:
+        with self._lock:
+            if len(self.samples) < HEDGE_MIN_SAMPLES:
+                return HEDGE_DEFAULT_DELAY
+            ordered = sorted(self.samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+class CircuitBreaker:
+    """Opens after BREAKER_FAILURES consecutive failures; lets one trial call through after the cooldown."""
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= BREAKER_COOLDOWN:
+                self.opened_at = time.monotonic()  # half-open: hold others back while the trial runs
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= BREAKER_FAILURES:
+                self.opened_at = time.monotonic()
+
+    def state(self) -> str:
+        return "closed" if self.opened_at is None else "open"
+
+
+_latency: Dict[str, LatencyTracker] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def _provider(name: str):
+    if name not in _breakers:
+        _latency.setdefault(name, LatencyTracker())
+        _breakers.setdefault(name, CircuitBreaker())
+    return _latency[name], _breakers[name]
+
+
+def hedged_get(provider: str, url: str, params: Dict[str, Any] = None, deadline: Deadline = None, timeout: float = 5) -> requests.Response:
+    """
+    GET with the request's remaining budget as timeout. If the first attempt hasn't answered
+    after the provider's p95 latency, a duplicate is sent and the first good response wins.
+
+    Raises:
+        DeadlineExceeded: no time left in the budget.
+        ProviderUnavailable: the provider's circuit breaker is open.
+        requests.RequestException: both attempts failed or timed out.
+    """
+    latency, breaker = _provider(provider)
+    if not breaker.allow():
+        raise ProviderUnavailable(provider)
+    budget = deadline.timeout(timeout) if deadline else timeout
+    start = time.monotonic()
+    end = start + budget
+
+    pending = {_executor.submit(requests.get, url, params=params, timeout=budget)}
+    done, _ = wait(pending, timeout=min(latency.p95(), budget))
+    if not done and end - time.monotonic() > 0:
+        pending.add(_executor.submit(requests.get, url, params=params, timeout=end - time.monotonic()))
+
+    error: Exception = requests.Timeout(f"{provider} did not answer within {budget:.2f}s")
+    failed = False
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            try:
+                response = future.result()
+            except requests.RequestException as e:
+                error = e
+                failed = failed or not isinstance(e, requests.Timeout)
+                continue
+            if response.status_code < 500:
+                latency.record(time.monotonic() - start)
+                breaker.success()
+                return response
+            error = requests.HTTPError(f"{provider} returned {response.status_code}", response=response)
+            failed = True
+
+    # A timeout only counts against the provider if it had the full timeout, not a nearly spent budget
+    if failed or budget >= timeout:
+        breaker.failure()
+    raise error
+
+
+def provider_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        name: {
+            "breaker": _breakers[name].state(),
+            "consecutive_failures": _breakers[name].failures,
+            "hedge_delay": round(_latency[name].p95(), 3),
+            "samples": len(_latency[name].samples),
+        }
+        for name in _breakers
+    }
@@ -1,8 +1,10 @@
-import os, requests, re
-from typing import List, Dict, Any
+import os, re
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 load_dotenv()
 import time
+from profiling import profile_stage
+from deadline import Deadline, DeadlineExceeded, ProviderUnavailable, hedged_get
 
 OMDB_API_KEY = os.getenv("OMDB_API_KEY")
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
@@ -13,7 +15,7 @@ def normalize_title(title: str) -> str:
         return ""
     return re.sub(r'[^a-z0-9 ]', '', title.lower())
 
-def search_omdb_movies_by_titles(titles: List[str], top_n: int = 5) -> List[Dict]:
+def search_omdb_movies_by_titles(titles: List[str], top_n: int = 5, deadline: Optional[Deadline] = None) -> List[Dict]:
     """Search OMDb for movies using exact title matches, retrieving detailed metadata."""
     if not OMDB_API_KEY:
         print("OMDb API key missing.")
@@ -25,7 +27,7 @@ def search_omdb_movies_by_titles(titles: List[str], top_n: int = 5) -> List[Dict
             continue
         try:
             url = f"http://www.omdbapi.com/?apikey={OMDB_API_KEY}&t={title}&type=movie&plot=full"
-            response = requests.get(url, timeout=5)
+            response = hedged_get("omdb", url, deadline=deadline)
             if response.status_code == 200:
                 data = response.json()
                 if data.get("Response") == "True" and data.get("imdbID"):
@@ -42,14 +44,21 @@ def search_omdb_movies_by_titles(titles: List[str], top_n: int = 5) -> List[Dict
                         "Metascore": data.get("Metascore", ""),
                         "Poster_Path": data.get("Poster", "")
                     })
-            time.sleep(0.2)  # Respect OMDb rate limits
+            time.sleep(min(0.2, deadline.remaining()) if deadline else 0.2)  # Respect OMDb rate limits
+        except (DeadlineExceeded, ProviderUnavailable) as e:
+            print(f"OMDb lookup skipped for title '{title}': {type(e).__name__}")
+            if deadline:
+                deadline.skip(f"OMDb: {title}")
+            continue
         except Exception as e:
             print(f"OMDb search error for title '{title}': {e}")
+            if deadline:
+                deadline.skip(f"OMDb: {title}")
             continue
 
     return results
 
-def search_tmdb_movies_by_titles(titles: List[str], top_n: int = 5) -> List[Dict]:
+def search_tmdb_movies_by_titles(titles: List[str], top_n: int = 5, deadline: Optional[Deadline] = None) -> List[Dict]:
     """Search TMDb for movies using exact title matches, retrieving detailed metadata."""
     if not TMDB_API_KEY:
         print("TMDb API key missing.")
@@ -69,7 +78,7 @@ def search_tmdb_movies_by_titles(titles: List[str], top_n: int = 5) -> List[Dict
                 "language": "en-US",
                 "page": 1
             }
-            response = requests.get(search_url, params=params, timeout=5)
+            response = hedged_get("tmdb", search_url, params=params, deadline=deadline)
             if response.status_code == 200:
                 search_data = response.json()
                 movies = search_data.get("results", [])
@@ -81,7 +90,7 @@ def search_tmdb_movies_by_titles(titles: List[str], top_n: int = 5) -> List[Dict
                             "language": "en-US",
                             "append_to_response": "keywords,credits"
                         }
-                        detail_response = requests.get(detail_url, params=detail_params, timeout=5)
+                        detail_response = hedged_get("tmdb", detail_url, params=detail_params, deadline=deadline)
                         if detail_response.status_code == 200:
                             detail_data = detail_response.json()
                             results.append({
@@ -100,13 +109,21 @@ def search_tmdb_movies_by_titles(titles: List[str], top_n: int = 5) -> List[Dict
                                 "Revenue": detail_data.get("revenue", 0),
                                 "Poster_Path": detail_data.get("poster_path", "")
                             })
-            time.sleep(0.3)  # Respect TMDb rate limits
+            time.sleep(min(0.3, deadline.remaining()) if deadline else 0.3)  # Respect TMDb rate limits
+        except (DeadlineExceeded, ProviderUnavailable) as e:
+            print(f"TMDb lookup skipped for title '{title}': {type(e).__name__}")
+            if deadline:
+                deadline.skip(f"TMDb: {title}")
+            continue
         except Exception as e:
             print(f"TMDb search error for title '{title}': {e}")
+            if deadline:
+                deadline.skip(f"TMDb: {title}")
             continue
 
     return results
 
+@profile_stage("merge_tmdb_omdb_titles")
 def merge_tmdb_omdb_titles(tmdb_results: List[Dict], omdb_results: List[Dict], top_n: int = 5) -> List[Dict]:
     """
     Merge TMDb and OMDb results, prioritizing TMDb for budget/revenue, filling gaps with OMDb.
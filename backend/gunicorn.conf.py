@@ -0,0 +1,33 @@
+# backend/gunicorn.conf.py
+# Pre-fork serving: gunicorn -c gunicorn.conf.py main:app
+# The master imports main.py once (loading the NER and emotion models), then forks workers
+# that share the model weights copy-on-write instead of each loading their own copy.
+import gc
+import os
+from serving import configure_torch_threads, memory_usage, worker_count
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = worker_count()
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "300"))
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the GC's generations so collections in
+    # workers don't touch (and therefore copy) the shared pages
+    gc.freeze()
+    server.log.info(f"Master ready with preloaded models: {memory_usage()}")
+
+
+def post_fork(server, worker):
+    import main
+
+    threads = configure_torch_threads(workers)
+    # HTTP connection pools must not be shared across processes
+    main.init_clients()
+    server.log.info(f"Worker {worker.pid} forked with {threads} torch threads")
+
+
+def post_worker_init(worker):
+    worker.log.info(f"Worker {worker.pid} memory: {memory_usage()}")
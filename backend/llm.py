@@ -0,0 +1,252 @@
+# backend/llm.py
+import os
+import json
+from collections import defaultdict
+from typing import List, Dict, Any, Tuple, Type, Optional
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from profiling import profile_stage
+from deadline import Deadline, DeadlineExceeded
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# Per call-site counters, exposed through /admin/llm_metrics
+_metrics: Dict[str, Dict[str, int]] = defaultdict(lambda: {
+    "calls": 0,
+    "invalid_sections": 0,
+    "section_retries": 0,
+    "repaired_calls": 0,
+    "failed_calls": 0,
+})
+
+
+class LLMOutputError(Exception):
+    """Raised when a completion still fails schema validation after section retries."""
+
+    def __init__(self, name: str, errors: Dict[str, str]):
+        self.name = name
+        self.errors = errors
+        super().__init__(f"{name}: invalid sections {sorted(errors)}")
+
+
+class IncrementalObjectParser:
+    """
+    Incrementally scan streamed JSON text and emit each member of the object at `depth`
+    (1 = top-level object) as soon as its value is complete. With `wrapper`, only members of
+    the object under that top-level key are emitted. Text before the first brace, such as a
+    Markdown fence, is ignored.
+    """
+
+    def __init__(self, depth: int = 1, wrapper: Optional[str] = None):
+        self.target = depth
+        self.wrapper = wrapper
+        self.key: Optional[str] = None
+        self.key_start: Optional[int] = None
+        self.last_string: Optional[str] = None
+        self.text = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.member_start: Optional[int] = None
+
+    def _emit(self, end: int) -> List[Tuple[str, Any]]:
+        member = self.text[self.member_start:end].strip()
+        if not member:
+            return []
+        try:
+            return list(json.loads("{" + member + "}").items())
+        except json.JSONDecodeError:
+            return [(None, member)]
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk and return the (key, value) members completed by it."""
+        self.text += chunk
+        completed = []
+        for i in range(self.pos, len(self.text)):
+            c = self.text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.key_start is not None:
+                        self.last_string = self.text[self.key_start:i + 1]
+                        self.key_start = None
+                continue
+            if c == '"' and self.depth > 0:
+                self.in_string = True
+                if self.depth == 1:
+                    self.key_start = i
+            elif c == ":" and self.depth == 1 and self.last_string is not None:
+                # Track the top-level key so only the wrapper's members are collected
+                self.key = json.loads(self.last_string)
+                self.last_string = None
+            elif c in "{[":
+                self.depth += 1
+                if c == "{" and self.depth == self.target and (self.wrapper is None or self.key == self.wrapper):
+                    self.member_start = i + 1
+            elif c in "}]":
+                if self.depth == self.target and self.member_start is not None:
+                    completed.extend(self._emit(i))
+                    self.member_start = None
+                self.depth -= 1
+            elif c == ",":
+                if self.depth == 1:
+                    self.key = self.last_string = None
+                if self.depth == self.target and self.member_start is not None:
+                    completed.extend(self._emit(i))
+                    self.member_start = i + 1
+        self.pos = len(self.text)
+        return completed
+
+
+def _validate_section(model_cls: Type[BaseModel], key: str, value: Any) -> Optional[str]:
+    """Validate one field of model_cls; returns an error message or None."""
+    try:
+        TypeAdapter(model_cls.model_fields[key].annotation).validate_python(value)
+        return None
+    except ValidationError as e:
+        return str(e)
+
+
+def _section_schema(model_cls: Type[BaseModel], keys: List[str]) -> str:
+    schema = model_cls.model_json_schema()
+    return json.dumps({
+        "type": "object",
+        "properties": {k: schema["properties"][k] for k in keys},
+        "required": keys,
+        "$defs": schema.get("$defs", {}),
+    })
+
+
+@profile_stage("llm")
+def complete_json(
+    client,
+    name: str,
+    messages: List[Dict[str, str]],
+    model_cls: Type[BaseModel],
+    wrapper: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    **params,
+) -> BaseModel:
+    """
+    Request JSON output, validate each field of `model_cls` as it streams in and re-ask only
+    for the fields that are missing or invalid.
+
+    Args:
+        client: OpenAI client.
+        name: Call-site name used for metrics.
+        messages: Chat messages for the completion.
+        model_cls: Pydantic model the JSON object must satisfy.
+        wrapper: Key the object is nested under in the response (e.g. "story_impact_report").
+        deadline: Request budget; each call gets only the time left (without SDK retries) and
+            repairs stop when it runs out.
+        **params: Passed through to chat.completions.create (model, temperature, max_tokens).
+
+    Returns:
+        Validated model_cls instance.
+
+    Raises:
+        LLMOutputError: if sections are still invalid after LLM_MAX_RETRIES repair rounds.
+        DeadlineExceeded: if the budget is spent before the output is complete.
+    """
+    stats = _metrics[name]
+
+    parser = IncrementalObjectParser(depth=2 if wrapper else 1, wrapper=wrapper)
+    sections: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    if deadline:
+        # The SDK retries timeouts with the same timeout, which would overrun the budget
+        client = client.with_options(max_retries=0)
+        params["timeout"] = deadline.timeout()
+    # Closing the stream on exit drops the connection if we stop reading early at the deadline
+    with client.chat.completions.create(
+        messages=messages, response_format={"type": "json_object"}, stream=True, **params
+    ) as stream:
+        for chunk in stream:
+            if deadline and deadline.expired():
+                break
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            for key, value in parser.feed(chunk.choices[0].delta.content):
+                if key not in model_cls.model_fields:
+                    continue
+                error = _validate_section(model_cls, key, value)
+                if error:
+                    errors[key] = error
+                else:
+                    sections[key] = value
+    if deadline and deadline.expired():
+        # Output cut off by the budget, not invalid: don't count it against the model
+        raise DeadlineExceeded()
+
+    stats["calls"] += 1
+    for key, field in model_cls.model_fields.items():
+        if key not in sections and key not in errors and field.is_required():
+            errors[key] = "missing"
+    stats["invalid_sections"] += len(errors)
+
+    retries = 0
+    while errors and retries < LLM_MAX_RETRIES and not (deadline and deadline.expired()):
+        if deadline:
+            params["timeout"] = deadline.timeout()
+        retries += 1
+        keys = sorted(errors)
+        stats["section_retries"] += len(keys)
+        repair = [
+            *messages,
+            {"role": "assistant", "content": parser.text},
+            {
+                "role": "user",
+                "content": (
+                    f"These fields of your JSON were missing or invalid: {json.dumps(errors)}\n"
+                    f"Return ONLY a JSON object with corrected values for exactly these keys, "
+                    f"matching this JSON schema: {_section_schema(model_cls, keys)}"
+                ),
+            },
+        ]
+        response = client.chat.completions.create(
+            messages=repair, response_format={"type": "json_object"}, **params
+        )
+        try:
+            fixed = json.loads(response.choices[0].message.content or "")
+        except json.JSONDecodeError as e:
+            errors = {k: f"repair response was not JSON: {e}" for k in keys}
+            continue
+        if not isinstance(fixed, dict):
+            errors = {k: "repair response was not a JSON object" for k in keys}
+            continue
+        if wrapper and isinstance(fixed.get(wrapper), dict):
+            fixed = fixed[wrapper]
+        for key in keys:
+            error = _validate_section(model_cls, key, fixed.get(key)) if key in fixed else "missing"
+            if error:
+                errors[key] = error
+            else:
+                sections[key] = fixed[key]
+                del errors[key]
+
+    if errors and retries < LLM_MAX_RETRIES and deadline and deadline.expired():
+        raise DeadlineExceeded()
+    if errors:
+        stats["failed_calls"] += 1
+        print(f"LLM output for {name} failed validation: {errors}")
+        raise LLMOutputError(name, errors)
+    if retries:
+        stats["repaired_calls"] += 1
+    return model_cls.model_validate(sections)
+
+
+def llm_metrics() -> Dict[str, Dict[str, Any]]:
+    """Counters per call site plus retry and failure rates."""
+    report = {}
+    for name, stats in _metrics.items():
+        calls = stats["calls"] or 1
+        report[name] = {
+            **stats,
+            "retry_rate": round((stats["repaired_calls"] + stats["failed_calls"]) / calls, 4),
+            "failure_rate": round(stats["failed_calls"] / calls, 4),
+        }
+    return report
@@ -1,15 +1,25 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request, Depends
+from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Dict, Any
 from openai import OpenAI, OpenAIError, AsyncOpenAI
 import os
-import json
 import numpy as np
 from transformers import pipeline
-from models import AnalysisResponse, StoryRequest, EmotionalArcPoint, Character, StoryImpactReport
+from models import AnalysisResponse, StoryRequest, EmotionalArcPoint, Character, StoryImpactReport, ComparableTitles, CharacterList, StoryStructure, StoryTags, AnalyticsQuery
 from utils import *
 from dotenv import load_dotenv
 from fetch_data import *
+from beat_detection import detect_beats
+from serving import memory_usage
+from synopsis_index import SynopsisIndex
+from catalog import get_catalog, reset_catalog
+from llm import complete_json, llm_metrics, LLMOutputError
+from profiling import profile_request, profile_stage, list_profiles, profile_artifact
+from admission import admit, admission_stats, Overloaded
+from deadline import Deadline, DeadlineExceeded, provider_stats
+from concurrent.futures import ThreadPoolExecutor
+from analysis_store import AnalysisStore, AnalyticsQueryError, row_from_report, row_from_analysis
 
 load_dotenv()
 
@@ -17,6 +27,8 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY environment variable is not set")
+# Required in X-Admin-Token for /admin endpoints and per-request profiling; both are off if unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 # Initialize FastAPI app
 app = FastAPI()
@@ -33,17 +45,130 @@ app.add_middleware(
 # Configure OpenAI
 client = OpenAI(api_key=OPENAI_API_KEY)
 
+def init_clients():
+    """(Re)create HTTP clients; called in each worker after a pre-fork so connection pools aren't shared."""
+    global client
+    client = OpenAI(api_key=OPENAI_API_KEY)
+    reset_catalog()
+
 # Hugging Face pipelines (configurable models)
 NER_MODEL = os.getenv("NER_MODEL", "dslim/bert-base-NER")
 EMOTION_MODEL = os.getenv("EMOTION_MODEL", "j-hartmann/emotion-english-distilroberta-base")
-ner = pipeline("ner", model=NER_MODEL, aggregation_strategy="simple")
-emotion_model = pipeline(
+# Near-duplicate synopsis reuse: "market" reuses comparable titles + market context,
+# "report" returns the whole stored report, "off" disables the lookup
+SYNOPSIS_REUSE = os.getenv("SYNOPSIS_REUSE", "market").lower()
+SYNOPSIS_REUSE_THRESHOLD = float(os.getenv("SYNOPSIS_REUSE_THRESHOLD", "0.8"))
+synopsis_index = SynopsisIndex(os.getenv("SYNOPSIS_INDEX_PATH", "synopsis_index.jsonl"))
+# Columnar store of every completed analysis, queried by /analytics
+analysis_store = AnalysisStore()
+
+def store_analysis(row: Dict[str, Any]):
+    """Persist an analysis for portfolio analytics without failing the request on store errors."""
+    try:
+        analysis_store.append(row)
+    except Exception as e:
+        print(f"Failed to store analysis: {e}")
+# "gpt" (default) asks GPT for beats per chunk, "local" detects them from the scene emotion series
+BEAT_DETECTION = os.getenv("BEAT_DETECTION", "gpt").lower()
+# End-to-end time budgets (seconds); the synopsis report call keeps REPORT_LLM_RESERVE for itself
+SYNOPSIS_DEADLINE = float(os.getenv("SYNOPSIS_DEADLINE", "30"))
+REPORT_LLM_RESERVE = float(os.getenv("REPORT_LLM_RESERVE", "12"))
+ANALYZE_DEADLINE = float(os.getenv("ANALYZE_DEADLINE", "300"))
+ner = profile_stage("ner")(pipeline("ner", model=NER_MODEL, aggregation_strategy="simple"))
+emotion_model = profile_stage("emotion")(pipeline(
     "text-classification",
     model=EMOTION_MODEL,
     return_all_scores=True
-)
+))
+
+def is_admin(token: str) -> bool:
+    """Admin access requires ADMIN_TOKEN to be configured; without it admin features stay off."""
+    return bool(ADMIN_TOKEN) and token == ADMIN_TOKEN
+
+def require_admin(token: str):
+    if not is_admin(token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Profile a request when an admin sends X-Profile: 1 (or PROFILE_REQUESTS=1 is set)."""
+    if request.url.path.startswith("/admin"):
+        return await call_next(request)
+    enabled = request.headers.get("X-Profile") == "1" and is_admin(request.headers.get("X-Admin-Token"))
+    async with profile_request(request.url.path, enabled) as profile:
+        response = await call_next(request)
+        if profile:
+            profile.status_code = response.status_code
+            response.headers["X-Profile-Id"] = profile.id
+    return response
+
+@app.get("/admin/memory")
+def worker_memory(x_admin_token: str = Header(None)):
+    """Unique vs shared resident memory of the worker serving this request."""
+    require_admin(x_admin_token)
+    return memory_usage()
+
+@app.get("/admin/llm_metrics")
+def llm_output_metrics(x_admin_token: str = Header(None)):
+    """Schema validation failures and section retry rates per LLM call site."""
+    require_admin(x_admin_token)
+    return llm_metrics()
+
+@app.get("/admin/admission")
+def admission_metrics(x_admin_token: str = Header(None)):
+    """Queue depth, active requests and shed counts per admission lane."""
+    require_admin(x_admin_token)
+    return admission_stats()
+
+async def admission_slot(request: Request, req: StoryRequest):
+    """Admit the request into the cheap or expensive lane, or shed it with 429 + Retry-After."""
+    try:
+        async with admit(request.url.path, len(req.story)):
+            yield
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Server busy - please retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+@app.get("/admin/upstreams")
+def upstream_metrics(x_admin_token: str = Header(None)):
+    """Circuit breaker state and hedge delay per metadata provider."""
+    require_admin(x_admin_token)
+    return provider_stats()
 
-def similar_movies(synopsis: str) -> List[str]:
+@app.post("/analytics")
+def analytics(query: AnalyticsQuery, x_admin_token: str = Header(None)):
+    """Group-by, filter and percentile aggregations over all stored analyses."""
+    require_admin(x_admin_token)
+    try:
+        return analysis_store.query(
+            query.metric,
+            group_by=query.group_by,
+            filters=query.filters,
+            percentiles=query.percentiles,
+            limit=query.limit
+        )
+    except AnalyticsQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/admin/profiles")
+def profiles(x_admin_token: str = Header(None)):
+    """Stored request profiles with per-stage time and allocation totals."""
+    require_admin(x_admin_token)
+    return list_profiles()
+
+@app.get("/admin/profiles/{profile_id}")
+def profile_detail(profile_id: str, format: str = "json", x_admin_token: str = Header(None)):
+    """A stored profile: 'json' summary with top allocation sites or 'folded' flame graph stacks."""
+    require_admin(x_admin_token)
+    path = profile_artifact(profile_id, format)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json" if format == "json" else "text/plain")
+
+def similar_movies(synopsis: str, deadline: Deadline = None) -> List[str]:
     prompt = f"""
     You are a discerning film recommendation engine, modeled after expert critics like Roger Ebert or Pauline Kael. 
     Your recommendations are thoughtful, precise, and based on deep analysis of thematic resonance, tonal alignment, 
@@ -61,39 +186,28 @@ def similar_movies(synopsis: str) -> List[str]:
     - Setting and atmosphere (e.g., urban paranoia, rural dread).
     - Emotional tone (e.g., escalating tension, ironic twists, cathartic horror).
 
-    Output strictly as a **valid JSON array of strings**, containing only the movie titles, in chronological release order (earliest first). Example: ["The Shining", "Rosemary's Baby", "Hereditary"]. 
-    If zero matches, return an empty array [].
+    Output strictly as a **valid JSON object** {{"titles": [...]}} whose array contains only the movie titles, in chronological release order (earliest first). Example: {{"titles": ["The Shining", "Rosemary's Baby", "Hereditary"]}}. 
+    If zero matches, return {{"titles": []}}.
 
     Synopsis: {synopsis}
 
     """
 
     try:
-        response = client.chat.completions.create(
+        data = complete_json(
+            client,
+            "similar_movies",
+            [{"role": "user", "content": prompt}],
+            ComparableTitles,
+            deadline=deadline,
             model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
             temperature=0,
             max_tokens=3000
         )
-        
-        print("Is it here")
-        content = response.choices[0].message.content.strip()
+        return list(dict.fromkeys([item.strip() for item in data.titles if item.strip()]))
 
-        if content.startswith("```"):
-            content = content.strip("`").replace("json", "").strip()
-
-        # Parse JSON safely
-        data = json.loads(content)
-
-        if isinstance(data, list) and all(isinstance(item, str) and item.strip() for item in data):
-            return list(dict.fromkeys([item.strip() for item in data if item.strip()]))
-        else:
-            print("Unexpected format, got:", type(data))
-            return []
-
-    except json.JSONDecodeError as e:
-        print("JSON decode error:", e)
-        print("Raw content:", content)
+    except LLMOutputError as e:
+        print("Unexpected format:", e.errors)
         return []
     except Exception as e:
         print("Error analyzing synopsis:", e)
@@ -102,14 +216,14 @@ def similar_movies(synopsis: str) -> List[str]:
 
 
 # To fetch movies from omdb and tmdb api call and build market context
-def build_market_context(synopsis: str, top_n: int = 5) -> str:
+def build_market_context(synopsis: str, top_n: int = 5, deadline: Deadline = None) -> str:
     """
     Build market context string for a movie treatment using TMDb (main) + OMDb (fallback).
     Uses similar_movies() to find comparable films based on thematic, tonal, and narrative alignment.
-    No local database required.
+    No local database required. Lookups that don't fit in the deadline are recorded in deadline.skipped.
     """
     # Step 1: Find similar movies
-    movie_titles = similar_movies(synopsis)
+    movie_titles = similar_movies(synopsis, deadline=deadline)
     
     print("Maaybe Here")
     if not movie_titles:
@@ -117,15 +231,22 @@ def build_market_context(synopsis: str, top_n: int = 5) -> str:
 
     print(f"Found {len(movie_titles)} comparable movies: {movie_titles}")
 
-    # Step 2: Search TMDb and OMDb using movie titles
-    tmdb_results = search_tmdb_movies_by_titles(movie_titles, top_n=top_n)
-    omdb_results = search_omdb_movies_by_titles(movie_titles, top_n=top_n)
+    # Step 2: Resolve titles in the local catalog, then search TMDb and OMDb for the misses
+    catalog = get_catalog()
+    catalog_results, missing_titles = catalog.lookup_titles(movie_titles, top_n, deadline) if catalog else ([], movie_titles)
+    if catalog:
+        print(f"Catalog resolved {len(catalog_results)} titles, {len(missing_titles)} need live lookup")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        tmdb_future = pool.submit(search_tmdb_movies_by_titles, missing_titles, top_n, deadline)
+        omdb_future = pool.submit(search_omdb_movies_by_titles, missing_titles, top_n, deadline)
+        tmdb_results = catalog_results + tmdb_future.result()
+        omdb_results = omdb_future.result()
 
     # Step 3: Merge TMDb and OMDb results
     all_results = merge_tmdb_omdb_titles(tmdb_results, omdb_results, top_n=top_n)
 
     if not all_results:
-        return "No comparable movies found for the provided synopsis."
+        return "No comparable movies found for the provided synopsis.", []
 
     print(f"Retrieved details for {len(all_results)} comparable movies")
 
@@ -141,7 +262,7 @@ def build_market_context(synopsis: str, top_n: int = 5) -> str:
         poster_base_url = "https://image.tmdb.org/t/p/w500/"
         poster_path = movie.get("Poster_Path")  # .get returns None by default if key is missing
 
-        if "https://" not in poster_path and poster_path is not None:
+        if poster_path is not None and "https://" not in poster_path:
           poster_url = f"{poster_base_url}{poster_path}" if poster_path else None
         else:
             poster_url = poster_path
@@ -215,7 +336,8 @@ def build_market_context(synopsis: str, top_n: int = 5) -> str:
 # Analyze synopsis not more than 8 pages
 # ---------------------------------------------------------------
 @app.post("/analyze_synopsis")
-def analyze_synopsis(req: StoryRequest):
+@profile_stage("analyze_synopsis")
+def analyze_synopsis(req: StoryRequest, _slot=Depends(admission_slot)):
     """
     Analyze a movie synopsis for creative and commercial potential.
     """
@@ -225,8 +347,26 @@ def analyze_synopsis(req: StoryRequest):
 
         print("Here")
         
+        # Reuse a prior analysis of a near-identical synopsis when possible
+        reused = synopsis_index.lookup(req.story, SYNOPSIS_REUSE_THRESHOLD) if SYNOPSIS_REUSE != "off" else None
+        if reused and not reused["comparable_movies"]:
+            # Entries without comparables come from a failed market lookup; don't propagate them
+            reused = None
+        if reused and SYNOPSIS_REUSE == "report":
+            result = dict(reused["report"])
+            result["metadata"] = {**result.get("metadata", {}), "reused_analysis": True, "similarity": reused["similarity"]}
+            return result
+
+        # Market lookups get the request budget minus what the report call needs
+        deadline = Deadline(SYNOPSIS_DEADLINE)
+        market_deadline = deadline.reserve(REPORT_LLM_RESERVE)
+
         # Build market context from OMDb/TMDb
-        market_context, comparable_movies = build_market_context(req.story)
+        if reused:
+            market_context, comparable_movies = reused["market_context"], reused["comparable_movies"]
+        else:
+            market_context, comparable_movies = build_market_context(req.story, deadline=market_deadline)
+        partial_market_data = bool(deadline.skipped) or market_deadline.expired()
         print("Its is here")
         # A clear and robust openai script for good JSON based response
         prompt = f"""
@@ -272,6 +412,7 @@ def analyze_synopsis(req: StoryRequest):
                 }},
                 "characters": [
                     {{
+                        "name": "Character name",
                         "role": "Protagonist",
                         "description_short": "A brief description of their personality, goals, and arc.",
                         "attributes": {{
@@ -295,71 +436,65 @@ def analyze_synopsis(req: StoryRequest):
         IMPORTANT: Return ONLY the JSON object above with real data for this specific synopsis. Ensure all values are valid JSON (use double quotes, no trailing commas).
         """
 
-        # Using the OpenAI client
+        # Using the OpenAI client; the report is validated section by section as it streams
         try:
-          response = client.chat.completions.create(
-              model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-              messages=[
-                  {
-                      "role": "system", 
-                      "content": "You are a precise JSON generator and Hollywood market analyst. Always respond with valid JSON only, incorporating market data and competitive insights. No explanations or additional text."
-                  },
-                  {"role": "user", "content": prompt}
-              ],
-              temperature=0.45,
-              max_tokens=3000
-          )
-
-          content = response.choices[0].message.content.strip()
+            report = complete_json(
+                client,
+                "analyze_synopsis",
+                [
+                    {
+                        "role": "system", 
+                        "content": "You are a precise JSON generator and Hollywood market analyst. Always respond with valid JSON only, incorporating market data and competitive insights. No explanations or additional text."
+                    },
+                    {"role": "user", "content": prompt}
+                ],
+                StoryImpactReport,
+                wrapper="story_impact_report",
+                deadline=deadline,
+                model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+                temperature=0.45,
+                max_tokens=3000
+            )
         except OpenAIError as e:
             print("Error processing synopsis due to openai error")
             print(e)
             raise HTTPException(status_code=500)
-        
-        print("OpenAI Generated content is")
-        print(content)
-
-        if not content:
-            raise HTTPException(status_code=500, detail="Empty response from OpenAI")
-        try:
-            content = content.strip()
-            if content.startswith("```json"):
-                content = content.replace("```json")
-            if content.startswith("```"):
-                content = content.replace("```", "").strip()
-            
-            parsed = json.loads(content)
-            
-            if "story_impact_report" not in parsed:
-                raise ValueError("Missing 'story_impact_report' key in response")
-            
-            # Add market context to response for transparency (optional)
-            result = parsed["story_impact_report"]
-            
-            if market_context:
-                result["metadata"] = {
-                    "market_search_performed": True,
-                    "comparable_movies_found": len(comparable_movies),
-                    "analysis_timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-                }
-                result["similar_movies"] = comparable_movies
-            else:
-                result["metadata"] = {
-                    "market_search_performed": False,
-                    "reason": "API keys not configured"
-                }
-            
-
-            return result
-            
-        except json.JSONDecodeError as json_err:
-            print(f"JSON Parse Error: {json_err}")
-            print(f"Raw response: {content[:500]}...")  # First 500 chars for debugging
-            
+        except DeadlineExceeded:
+            raise HTTPException(status_code=504, detail="Analysis ran out of time - please try again")
+        except LLMOutputError as e:
+            print(f"Invalid analysis sections: {e.errors}")
             raise HTTPException(
                 status_code=500, 
                 detail="Failed to parse analysis - please try again with a different synopsis"
             )
+
+        # Add market context to response for transparency (optional)
+        result = report.model_dump()
+
+        if market_context:
+            result["metadata"] = {
+                "market_search_performed": True,
+                "comparable_movies_found": len(comparable_movies),
+                "analysis_timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+            }
+            if reused:
+                result["metadata"]["market_context_reused"] = True
+                result["metadata"]["similarity"] = reused["similarity"]
+            if partial_market_data:
+                result["metadata"]["partial_market_data"] = True
+                result["metadata"]["skipped_lookups"] = deadline.skipped
+            result["similar_movies"] = comparable_movies
+        else:
+            result["metadata"] = {
+                "market_search_performed": False,
+                "reason": "API keys not configured"
+            }
+
+        if not reused and not partial_market_data and comparable_movies:
+            synopsis_index.add(req.story, market_context, comparable_movies, result)
+        store_analysis(row_from_report(result))
+
+        return result
             
     except HTTPException:
         raise
@@ -371,9 +506,15 @@ def analyze_synopsis(req: StoryRequest):
             detail=f"Analysis failed: {str(e) if os.getenv('DEBUG') else 'Internal server error'}"
         )
 
+# Character fields requested from GPT, matching models.Character
+CHARACTER_SCHEMA_PROMPT = (
+    'name, role, description_short and attributes '
+    '{"archetype": str, "audience_appeal_score": int from -10 to 10, "comparable_actors": [str]}'
+)
+
 # Todo: Needs work on this, its for full script
 # Character Analysis with NER
-def analyze_characters(story: str) -> List[Dict[str, str]]:
+def analyze_characters(story: str, deadline: Deadline = None) -> List[Dict[str, str]]:
     """Extract and analyze characters using NER and screenplay parsing."""
     # Extract names from dialogue cues
     names = extract_character_names(story)
@@ -393,8 +534,8 @@ def analyze_characters(story: str) -> List[Dict[str, str]]:
     # Analyze characters with GPT
     prompt = f"""
     You are a Hollywood story analyst. Assign roles and archetypes to these characters
-    based on the story context. Output as JSON list of objects with fields:
-    name, role, archetype, description.
+    based on the story context. Output as a JSON object {{"characters": [...]}} with one object
+    per character with fields: {CHARACTER_SCHEMA_PROMPT}.
 
     Characters: {all_names}
 
@@ -402,25 +543,30 @@ def analyze_characters(story: str) -> List[Dict[str, str]]:
     {story[:10000]}  # Use full story for short scripts, first 10,000 chars for long
     """
     try:
-        response = client.chat.completions.create(
+        result = complete_json(
+            client,
+            "analyze_characters",
+            [{"role": "user", "content": prompt}],
+            CharacterList,
+            deadline=deadline,
             model=os.getenv("OPENAI_MODEL", "gpt-4o"),
-            messages=[{"role": "user", "content": prompt}],
             temperature=0.4
         )
-        return json.loads(response.choices[0].message.content)
+        return [c.model_dump() for c in result.characters]
     except OpenAIError as e:
         raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
-    except json.JSONDecodeError as e:
+    except LLMOutputError as e:
         raise HTTPException(status_code=500, detail=f"Invalid JSON response from OpenAI: {str(e)}")
 
 # Story Structure Analysis
-def analyze_story_structure(story: str, is_short: bool) -> Dict[str, Any]:
+def analyze_story_structure(story: str, is_short: bool, deadline: Deadline = None) -> Dict[str, Any]:
     """
     Analyze screenplay for narrative beats and characters using a single GPT call.
     
     Args:
         story: The input screenplay text.
         is_short: True if script is 3–4 pages, False for longer scripts.
+        deadline: Request time budget shared by the GPT calls.
         
     Returns:
         Dictionary with 'beats' (object) and 'characters' (list).
@@ -435,12 +581,16 @@ def analyze_story_structure(story: str, is_short: bool) -> Dict[str, Any]:
         Tasks:
         1. Identify narrative beats (Beginning, Middle, End). For each, provide 1–2 paragraphs of the story text.
         2. Assign roles and archetypes to these characters: {initial_names}.
-           Output as a JSON list of objects with fields: name, role, archetype, description.
+           Output as a JSON list of objects with fields: {CHARACTER_SCHEMA_PROMPT}.
         Return a JSON object with 'beats' (object) and 'characters' (list).
 
         Screenplay:
         {story}
         """
+    elif BEAT_DETECTION == "local":
+        # Long scripts: beats from the scene-level emotion series, no GPT calls for structure
+        beats = detect_beats(story, emotion_model)
+        return {"beats": beats, "characters": analyze_characters(story, deadline=deadline)[:5]}
     else:
         # Chunk for long scripts
         chunks = chunk_text(story, max_length=20000)
@@ -453,42 +603,47 @@ def analyze_story_structure(story: str, is_short: bool) -> Dict[str, Any]:
             1. Identify narrative beats (Beginning, End of Act I, Midpoint, All is Lost Moment, Climax, End).
                For each, provide 2–4 paragraphs of the story text.
             2. Assign roles and archetypes to these characters: {initial_names}.
-               Output as a JSON list of objects with fields: name, role, archetype, description.
+               Output as a JSON list of objects with fields: {CHARACTER_SCHEMA_PROMPT}.
             Return a JSON object with 'beats' (object) and 'characters' (list).
 
             Screenplay chunk:
             {chunk}
             """
             try:
-                response = client.chat.completions.create(
+                result = complete_json(
+                    client,
+                    "analyze_story_structure",
+                    [{"role": "user", "content": prompt}],
+                    StoryStructure,
+                    deadline=deadline,
                     model=os.getenv("OPENAI_MODEL", "gpt-4o"),
-                    messages=[{"role": "user", "content": prompt}],
                     temperature=0.4
                 )
-                result = json.loads(response.choices[0].message.content)
-                beats.update(result.get("beats", {}))
-                if result.get("characters"):
-                    existing_names = {c["name"] for c in characters}
-                    for c in result["characters"]:
-                        if c["name"] not in existing_names:
-                            characters.append(c)
+                beats.update(result.beats)
+                existing_names = {c["name"] for c in characters}
+                for c in result.characters:
+                    if c.name not in existing_names:
+                        characters.append(c.model_dump())
             except OpenAIError as e:
                 raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
-            except json.JSONDecodeError as e:
+            except LLMOutputError as e:
                 raise HTTPException(status_code=500, detail=f"Invalid JSON response from OpenAI: {str(e)}")
         return {"beats": beats, "characters": characters[:5]}
     
     # Single call for short scripts
     try:
-        response = client.chat.completions.create(
+        return complete_json(
+            client,
+            "analyze_story_structure",
+            [{"role": "user", "content": prompt}],
+            StoryStructure,
+            deadline=deadline,
             model=os.getenv("OPENAI_MODEL", "gpt-4o"),
-            messages=[{"role": "user", "content": prompt}],
             temperature=0.4
-        )
-        return json.loads(response.choices[0].message.content)
+        ).model_dump()
     except OpenAIError as e:
         raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
-    except json.JSONDecodeError as e:
+    except LLMOutputError as e:
         raise HTTPException(status_code=500, detail=f"Invalid JSON response from OpenAI: {str(e)}")
 
 # -------------------------------------------------------------------------------
@@ -496,7 +651,8 @@ def analyze_story_structure(story: str, is_short: bool) -> Dict[str, Any]:
 # Analyze full script or story
 # --------------------------------------------------------------------------------
 @app.post("/analyze", response_model=AnalysisResponse)
-def analyze_story(req: StoryRequest):
+@profile_stage("analyze")
+def analyze_story(req: StoryRequest, _slot=Depends(admission_slot)):
     """
     Analyze a screenplay for narrative beats, emotional arc, characters, and metadata.
     
@@ -515,6 +671,8 @@ def analyze_story(req: StoryRequest):
         if len(req.story) > 500000:  # ~250 pages
             raise HTTPException(status_code=400, detail="Screenplay exceeds maximum length")
 
+        deadline = Deadline(ANALYZE_DEADLINE)
+
         # Determine if script is short (3–4 pages, ~800 words or ~6000 chars)
         is_short = len(req.story) <= 6000
 
@@ -522,19 +680,19 @@ def analyze_story(req: StoryRequest):
         dialogue, action = separate_dialogue_action(req.story)
 
         # 1. Story structure and character analysis
-        structure = analyze_story_structure(req.story, is_short)
+        structure = analyze_story_structure(req.story, is_short, deadline=deadline)
         beats = structure["beats"]
         characters = [Character(**c) for c in structure["characters"]]
 
         # 2. Emotional arc (use dialogue for short scripts, beats for long)
         emotional_arc = []
         if is_short:
-            scores = emotion_model(dialogue or req.story[:5000])[0]
+            scores = emotion_model(dialogue or req.story[:5000], truncation=True)[0]
             valence, arousal = valence_arousal(scores)
             emotional_arc.append(EmotionalArcPoint(point="Overall", valence=valence, arousal=arousal))
         else:
             for point, text in beats.items():
-                scores = emotion_model(dialogue[:5000] if point in ["Beginning", "End of Act I"] else text)[0]
+                scores = emotion_model(dialogue[:5000] if point in ["Beginning", "End of Act I"] else text, truncation=True)[0]
                 valence, arousal = valence_arousal(scores)
                 emotional_arc.append(EmotionalArcPoint(point=point, valence=valence, arousal=arousal))
 
@@ -555,24 +713,31 @@ def analyze_story(req: StoryRequest):
         {req.story[:10000]}  # Use full story for short scripts, first 10,000 chars for long
         """
         try:
-            response = client.chat.completions.create(
+            extra = complete_json(
+                client,
+                "story_tags",
+                [{"role": "user", "content": prompt}],
+                StoryTags,
+                deadline=deadline,
                 model=os.getenv("OPENAI_MODEL", "gpt-4o"),
-                messages=[{"role": "user", "content": prompt}],
                 temperature=0.5
             )
-            extra = json.loads(response.choices[0].message.content)
         except OpenAIError as e:
             raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
-        except json.JSONDecodeError as e:
+        except LLMOutputError as e:
             raise HTTPException(status_code=500, detail=f"Invalid JSON response from OpenAI: {str(e)}")
 
-        return AnalysisResponse(
+        response = AnalysisResponse(
             emotional_arc=emotional_arc,
             characters=characters,
             story_score=story_score,
-            tags=extra["tags"],
-            audience=extra["audience"]
+            tags=extra.tags,
+            audience=extra.audience
         )
+        store_analysis(row_from_analysis(response))
+        return response
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Analysis ran out of time - please try again")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
     
@@ -1,6 +1,6 @@
 # backend/models.py
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Annotated
 
 class StoryRequest(BaseModel):
     story: str
@@ -35,11 +35,43 @@ class AnalysisResponse(BaseModel):
     tags: List[str]
     audience: List[str]
 
+class IntensityArcPoint(BaseModel):
+    point: str
+    intensity: int = Field(..., ge=-10, le=10)
+
+class ReportCharacter(BaseModel):
+    name: Optional[str] = None
+    role: str
+    description_short: str
+    attributes: CharacterAttributes
+
 class StoryImpactReport(BaseModel):
     title: str
     logline: str
     top_level_score: Dict[str, int]
-    emotional_arc_data: list[EmotionalArcPoint]
+    emotional_arc_data: list[IntensityArcPoint]
     key_insights: Dict[str, Any]
-    characters: list[Character]
-    pitch_ready_copy: Dict[str, Any]
\ No newline at end of file
+    characters: list[ReportCharacter]
+    pitch_ready_copy: Dict[str, Any]
+
+# Schemas for intermediate LLM outputs
+class ComparableTitles(BaseModel):
+    titles: List[str]
+
+class CharacterList(BaseModel):
+    characters: List[Character]
+
+class StoryStructure(BaseModel):
+    beats: Dict[str, str]
+    characters: List[Character]
+
+class StoryTags(BaseModel):
+    tags: List[str]
+    audience: List[str]
+
+class AnalyticsQuery(BaseModel):
+    metric: str
+    group_by: Optional[str] = None
+    filters: Dict[str, Any] = {}
+    percentiles: List[Annotated[float, Field(ge=0, le=100)]] = [50, 90]
+    limit: int = Field(50, ge=1, le=1000)
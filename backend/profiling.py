@@ -0,0 +1,194 @@
+# backend/profiling.py
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import tracemalloc
+import contextvars
+from collections import Counter, defaultdict
+from contextlib import contextmanager, asynccontextmanager
+from functools import wraps
+from typing import List, Dict, Any, Optional
+from starlette.concurrency import run_in_threadpool
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000
+PROFILE_TOP_ALLOCATIONS = 25
+PROFILE_MAX_KEEP = int(os.getenv("PROFILE_MAX_KEEP", "200"))
+
+_active: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("active_profile", default=None)
+# tracemalloc is process-wide, so only one request is profiled at a time
+_profile_lock = threading.Lock()
+
+
+class RequestProfile:
+    """
+    Sampling CPU profile plus tracemalloc allocation stats for one request, attributed to stages.
+    Stack samples are stored in folded format ("stage;frame;frame count") for flame graph tools.
+    """
+
+    def __init__(self, path: str):
+        self.id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+        self.path = path
+        self.status_code = 500
+        self.samples: Counter = Counter()
+        self.stages: Dict[str, Dict[str, float]] = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "alloc_bytes": 0, "peak_bytes": 0})
+        self.threads: Dict[int, List[str]] = {}
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        tracemalloc.start(10)
+        self.started = time.perf_counter()
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(PROFILE_SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            for ident, stack in list(self.threads.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                label = stack[-1] if stack else "(unstaged)"
+                self.samples[";".join([f"stage:{label}"] + names[::-1])] += 1
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time the enclosed work and record its allocations. tracemalloc is process-wide, so
+        alloc_bytes and peak_bytes also count memory allocated by concurrent requests, and a
+        nested stage resets the peak so the enclosing stage's peak only covers the part after it.
+        Treat them as approximate. CPU samples are attributed per thread and are exact.
+        """
+        ident = threading.get_ident()
+        stack = self.threads.setdefault(ident, [])
+        stack.append(name)
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            after, peak = tracemalloc.get_traced_memory()
+            stats = self.stages[name]
+            stats["calls"] += 1
+            stats["seconds"] += time.perf_counter() - start
+            stats["alloc_bytes"] += after - before
+            stats["peak_bytes"] = max(stats["peak_bytes"], peak - before)
+            stack.pop()
+
+    def stop(self) -> Dict[str, Any]:
+        """Stop sampling, write the artifacts and return the summary."""
+        self._stop.set()
+        self._sampler.join()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        top = snapshot.statistics("traceback")[:PROFILE_TOP_ALLOCATIONS]
+        summary = {
+            "id": self.id,
+            "path": self.path,
+            "status_code": self.status_code,
+            "seconds": round(time.perf_counter() - self.started, 4),
+            "samples": sum(self.samples.values()),
+            "stages": {name: {**s, "seconds": round(s["seconds"], 4)} for name, s in self.stages.items()},
+            "top_allocations": [
+                {"size_bytes": stat.size, "count": stat.count, "traceback": stat.traceback.format()}
+                for stat in top
+            ],
+        }
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, f"{self.id}.folded"), "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+        with open(os.path.join(PROFILE_DIR, f"{self.id}.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        prune_profiles()
+        return summary
+
+
+def prune_profiles(keep: int = PROFILE_MAX_KEEP):
+    """Delete the oldest stored profiles beyond the newest `keep` (ids sort by start time)."""
+    ids = sorted({os.path.splitext(name)[0] for name in os.listdir(PROFILE_DIR)}, reverse=True)
+    for profile_id in ids[keep:]:
+        for kind in ("json", "folded"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, f"{profile_id}.{kind}"))
+            except FileNotFoundError:
+                pass
+
+
+@asynccontextmanager
+async def profile_request(path: str, enabled: bool):
+    """
+    Profile the enclosed request if enabled (or PROFILE_REQUESTS=1) and no other profile is
+    running. Set profile.status_code before leaving; artifacts are written on exit in a worker
+    thread so the snapshot and file writes don't block the event loop.
+    """
+    if not (enabled or PROFILE_REQUESTS) or not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+    profile = RequestProfile(path)
+    token = _active.set(profile)
+    profile.start()
+    try:
+        yield profile
+    finally:
+        _active.reset(token)
+        try:
+            await run_in_threadpool(profile.stop)
+        finally:
+            _profile_lock.release()
+
+
+@contextmanager
+def stage(name: str):
+    """Attribute the enclosed work to a stage of the active request profile (no-op otherwise)."""
+    profile = _active.get()
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
+
+
+def profile_stage(name: str):
+    """Decorator form of stage() for functions and callables such as model pipelines."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active.get() is None:
+                return fn(*args, **kwargs)
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Summaries of stored profiles, newest first (without allocation tracebacks)."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith(".json"):
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                summary = json.load(f)
+            summary.pop("top_allocations", None)
+            profiles.append(summary)
+    return profiles
+
+
+def profile_artifact(profile_id: str, kind: str) -> Optional[str]:
+    """Path of a stored artifact ('json' or 'folded'), or None if it doesn't exist."""
+    if kind not in ("json", "folded") or not profile_id.replace("-", "").isalnum():
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{kind}")
+    return path if os.path.exists(path) else None
@@ -0,0 +1,49 @@
+# backend/serving.py
+import os
+from typing import Dict, Any
+
+
+def worker_count() -> int:
+    """Number of server worker processes (gunicorn/uvicorn convention: WEB_CONCURRENCY)."""
+    return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+
+def configure_torch_threads(workers: int = None) -> int:
+    """
+    Split the machine's cores between workers so per-worker intra-op pools don't oversubscribe.
+    TORCH_THREADS overrides the computed value.
+    """
+    import torch
+
+    workers = workers or worker_count()
+    threads = int(os.getenv("TORCH_THREADS", "0")) or max(1, (os.cpu_count() or 1) // workers)
+    torch.set_num_threads(threads)
+    return threads
+
+
+def memory_usage() -> Dict[str, Any]:
+    """
+    Report this process's resident memory split into unique (private) and shared pages, in MB.
+    Private memory is what each extra worker really costs; shared memory is the
+    copy-on-write model weights inherited from the preloading master.
+    """
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[-1] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return {"pid": os.getpid(), "available": False}
+
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    shared = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    return {
+        "pid": os.getpid(),
+        "available": True,
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "unique_mb": round(private / 1024, 1),
+        "shared_mb": round(shared / 1024, 1),
+    }
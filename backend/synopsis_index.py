@@ -0,0 +1,112 @@
+# backend/synopsis_index.py
+import os
+import re
+import json
+import zlib
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, MAX_HASH, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, MAX_HASH, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """Word n-gram shingles of a lowercased, punctuation-free synopsis."""
+    words = re.sub(r'[^a-z0-9 ]', ' ', text.lower()).split()
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature of the synopsis shingles using universal hashing (a*x + b) mod p."""
+    tokens = shingles(text)
+    if not tokens:
+        return np.full(NUM_PERM, MAX_HASH, dtype=np.uint64)
+    hashes = np.array([zlib.crc32(t.encode("utf-8")) for t in tokens], dtype=np.uint64)
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % MERSENNE_PRIME & MAX_HASH
+    return permuted.min(axis=0)
+
+
+def band_keys(signature: np.ndarray) -> List[bytes]:
+    """One LSH bucket key per band of the signature."""
+    return [bytes([b]) + signature[b * ROWS:(b + 1) * ROWS].tobytes() for b in range(BANDS)]
+
+
+class SynopsisIndex:
+    """
+    MinHash/LSH index over synopses of completed analyses, persisted as an append-only JSON lines
+    file. Entries written by other workers are picked up incrementally on the next lookup.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: List[Dict[str, Any]] = []
+        self.signatures: List[np.ndarray] = []
+        self.buckets: Dict[bytes, List[int]] = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def _insert(self, entry: Dict[str, Any], signature: np.ndarray):
+        idx = len(self.entries)
+        self.entries.append(entry)
+        self.signatures.append(signature)
+        for key in band_keys(signature):
+            self.buckets.setdefault(key, []).append(idx)
+
+    def _refresh(self):
+        """Load any entries appended to the file since the last read."""
+        try:
+            if os.path.getsize(self.path) <= self._offset:
+                return
+        except OSError:
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # partially written by another process; retry next time
+                self._offset += len(line.encode("utf-8"))
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._insert(entry, np.array(entry.pop("signature"), dtype=np.uint64))
+
+    def lookup(self, synopsis: str, threshold: float) -> Optional[Dict[str, Any]]:
+        """Return the most similar stored analysis with estimated Jaccard >= threshold, if any."""
+        signature = minhash(synopsis)
+        with self._lock:
+            self._refresh()
+            candidates = {i for key in band_keys(signature) for i in self.buckets.get(key, [])}
+            best, best_score = None, threshold
+            for i in candidates:
+                score = float(np.mean(self.signatures[i] == signature))
+                if score >= best_score:
+                    best, best_score = self.entries[i], score
+        if best is None:
+            return None
+        return {**best, "similarity": round(best_score, 3)}
+
+    def add(self, synopsis: str, market_context: str, comparable_movies: List[Dict], report: Dict[str, Any]):
+        """Index a completed analysis and append it to the persisted index."""
+        line = json.dumps({
+            "market_context": market_context,
+            "comparable_movies": comparable_movies,
+            "report": report,
+            "signature": minhash(synopsis).tolist(),
+        }) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self._refresh()
@@ -0,0 +1,64 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from admission import Lane, Overloaded
+
+
+def make_lane(deadline: float = 5.0) -> Lane:
+    return Lane("test", concurrency=1, max_queue=4, deadline=deadline, seconds_per_unit=0.01)
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        lane = make_lane()
+        await lane.acquire(1.0)
+        task = asyncio.ensure_future(lane.acquire(1.0))
+        await asyncio.sleep(0)
+        assert len(lane.waiters) == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert len(lane.waiters) == 0
+        assert lane.queued_cost == 0
+        lane.release()
+        assert lane.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancel_after_handover_releases_slot():
+    async def scenario():
+        lane = make_lane()
+        await lane.acquire(1.0)
+        task = asyncio.ensure_future(lane.acquire(1.0))
+        await asyncio.sleep(0)
+        lane.release()  # hands the slot to the waiter
+        task.cancel()  # ...which is cancelled before it resumes
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        else:
+            lane.release()  # wait_for on older Pythons returns the result instead of cancelling
+        assert lane.active == 0
+        assert len(lane.waiters) == 0
+
+    asyncio.run(scenario())
+
+
+def test_timeout_sheds_and_leaves_queue():
+    async def scenario():
+        lane = make_lane(deadline=0.01)
+        await lane.acquire(0.1)
+        with pytest.raises(Overloaded):
+            await lane.acquire(0.1)
+        assert lane.timed_out == 1
+        assert len(lane.waiters) == 0
+        lane.release()
+        assert lane.active == 0
+
+    asyncio.run(scenario())
@@ -1,6 +1,8 @@
 import re
+import numpy as np
 from typing import List, Tuple, Dict, Any
 from constants import AROUSAL_MAP, VALENCE_MAP
+from profiling import profile_stage
 
 def extract_character_names(script: str) -> List[str]:
     """Extract character names from screenplay dialogue cues."""
@@ -8,6 +10,7 @@ def extract_character_names(script: str) -> List[str]:
     names = re.findall(pattern, script, re.MULTILINE)
     return list(dict.fromkeys([name.split('(')[0].strip() for name in names]))
 
+@profile_stage("separate_dialogue_action")
 def separate_dialogue_action(script: str) -> Tuple[str, str]:
     """Separate dialogue and action lines in a screenplay."""
     dialogue = []
@@ -25,20 +28,26 @@ def separate_dialogue_action(script: str) -> Tuple[str, str]:
             action.append(line)
     return '\n'.join(dialogue), '\n'.join(action)
 
+@profile_stage("chunk_text")
 def chunk_text(text: str, max_length: int = 20000) -> List[str]:
     """Split text into chunks of max_length characters."""
     if len(text) <= max_length:
         return [text]
     return [text[i:i + max_length] for i in range(0, len(text), max_length)]
 
-def valence_arousal(scores: List[Dict[str, Any]]) -> Tuple[int, int]:
-    """Calculate valence and arousal scores from emotion model output."""
+def raw_valence_arousal(scores: List[Dict[str, Any]]) -> Tuple[float, float]:
+    """Calculate unscaled valence and arousal (roughly -1..1) from emotion model output."""
     valence, arousal = 0.0, 0.0
     for s in scores:
         label = s["label"].lower()
         if label in VALENCE_MAP:
             valence += s["score"] * VALENCE_MAP[label]
             arousal += s["score"] * AROUSAL_MAP[label]
+    return valence, arousal
+
+def valence_arousal(scores: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """Calculate valence and arousal scores from emotion model output."""
+    valence, arousal = raw_valence_arousal(scores)
     return int(np.clip(valence * 10, -10, 10)), int(np.clip(arousal * 10, -10, 10))
 
 